@@ -0,0 +1 @@
+# Lets tests under tests/ import the backend modules (parsing, schemas) directly.
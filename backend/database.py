@@ -1,56 +1,252 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
+from functools import lru_cache
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+
+# uvicorn's error logger is already configured at INFO by the server, so the
+# startup query-plan report shows up without this module touching logging config
+logger = logging.getLogger("uvicorn.error")
 
 # Environment variables are provided by the platform
 DATABASE_URL = os.getenv("DATABASE_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "appdb")
 
-_client = MongoClient(DATABASE_URL, uuidRepresentation="standard")
+# Connection pool and write concern, tunable per deployment
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "200"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "20"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "1")
+MONGO_JOURNAL = os.getenv("MONGO_JOURNAL", "false").lower() in ("1", "true", "yes")
+# Wire compression; the server picks the first one it also supports
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+MONGO_ZLIB_LEVEL = int(os.getenv("MONGO_ZLIB_LEVEL", "3"))
+# Concurrent insert_many chunks per bulk upload
+MONGO_BULK_CONCURRENCY = int(os.getenv("MONGO_BULK_CONCURRENCY", "4"))
+
+
+def _write_concern(w: str):
+    # "1", "2", ... are node counts; anything else is a tag such as "majority"
+    return int(w) if w.isdigit() else w
+
+
+_CLIENT_OPTIONS = dict(
+    uuidRepresentation="standard",
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    w=_write_concern(MONGO_WRITE_CONCERN),
+    journal=MONGO_JOURNAL,
+    retryWrites=True,
+    compressors=MONGO_COMPRESSORS,
+    zlibCompressionLevel=MONGO_ZLIB_LEVEL,
+)
+
+# Request handlers share the async client; the sync one only runs startup work
+_client = AsyncIOMotorClient(DATABASE_URL, **_CLIENT_OPTIONS)
 db = _client[DATABASE_NAME]
 
 # Ensure basic indexes for our collections when module is imported
 # This is idempotent; safe to call on every startup
 _db_inited = False
 
+# Indexes pinned by the list endpoints, so a plan flip as the collections grow
+# can't silently move them off their sort index
+DRAW_LIST_HINT = [("date", ASCENDING)]
+PRED_LIST_HINT = [("created_at", DESCENDING)]
+
+
+def _plan_stages(plan: Dict[str, Any]) -> str:
+    stages = []
+    while plan:
+        stages.append(plan.get("stage", "?"))
+        plan = plan.get("inputStage") or plan.get("queryPlan")
+    return " <- ".join(stages)
+
+
+def _log_list_plans(sync_db) -> None:
+    """Log executionStats for the hinted list queries so regressions show up at startup."""
+    for name, sort, hint in (
+        ("draw", [("date", DESCENDING)], DRAW_LIST_HINT),
+        ("prediction", [("created_at", DESCENDING)], PRED_LIST_HINT),
+    ):
+        try:
+            res = sync_db.command(
+                "explain",
+                {"find": name, "filter": {}, "sort": dict(sort), "hint": dict(hint), "limit": 200},
+                verbosity="executionStats",
+            )
+        except Exception as e:
+            logger.warning("explain for %s list query failed: %s", name, e)
+            continue
+        stats = res.get("executionStats", {})
+        logger.info(
+            "%s list plan: %s; %sms, %s keys / %s docs examined",
+            name,
+            _plan_stages(res.get("queryPlanner", {}).get("winningPlan", {})),
+            stats.get("executionTimeMillis"),
+            stats.get("totalKeysExamined"),
+            stats.get("totalDocsExamined"),
+        )
+
+
+def find_duplicate_draws(sync_db) -> List[Dict[str, Any]]:
+    """Group draws that share a date: ``[{"_id": date, "ids": [...]}, ...]``."""
+    return list(sync_db["draw"].aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$date", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+        {"$sort": {"_id": 1}},
+    ], allowDiskUse=True))
+
+
+def _migrate_legacy_indexes(sync_db) -> None:
+    """Prepare for the unique draw.date index and drop superseded indexes.
+
+    Earlier versions indexed draw.date without a unique constraint, so bulk
+    uploads could store the same date twice. Those rows are never removed
+    here: startup fails listing them, and migrate_dedupe_draws.py resolves
+    them explicitly.
+    """
+    draw_indexes = sync_db["draw"].index_information()
+    if "date_1" not in draw_indexes:
+        dupes = find_duplicate_draws(sync_db)
+        if dupes:
+            listing = "; ".join(f"{g['_id']}: {', '.join(map(str, g['ids']))}" for g in dupes)
+            raise RuntimeError(
+                f"cannot create the unique draw.date index, {len(dupes)} dates have more than one draw "
+                f"({listing}). Resolve them, e.g. with `python migrate_dedupe_draws.py`, and restart."
+            )
+    if "date_-1" in draw_indexes:
+        sync_db["draw"].drop_index("date_-1")
+    if "matched.latest_match_-1" in sync_db["prediction"].index_information():
+        sync_db["prediction"].drop_index("matched.latest_match_-1")
+
+
 def _ensure_indexes() -> None:
     global _db_inited
     if _db_inited:
         return
-    db["draw"].create_index([("date", DESCENDING)])
-    db["prediction"].create_index([("created_at", DESCENDING)])
-    db["prediction"].create_index([("matched.latest_match", DESCENDING)])
+    with MongoClient(DATABASE_URL, uuidRepresentation="standard") as client:
+        sync_db = client[DATABASE_NAME]
+        _migrate_legacy_indexes(sync_db)
+        # one draw per date; also serves the date-descending sorts
+        sync_db["draw"].create_index(DRAW_LIST_HINT, unique=True)
+        sync_db["prediction"].create_index(PRED_LIST_HINT)
+        sync_db["prediction"].create_index([("matched.latest_match.date", ASCENDING), ("matched.latest_match.total", DESCENDING)])
+        _log_list_plans(sync_db)
     _db_inited = True
 
 _ensure_indexes()
 
 
+@lru_cache(maxsize=None)
+def _coll(collection_name: str):
+    return db[collection_name]
+
+
+DRAW_COLL = _coll("draw")
+PRED_COLL = _coll("prediction")
+CACHE_COLL = _coll("cache")
+
+
 def _now() -> datetime:
     return datetime.now(timezone.utc)
 
 
-def create_document(collection_name: str, data: Dict[str, Any]) -> Dict[str, Any]:
+async def create_document(collection_name: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """Insert a document adding created_at/updated_at timestamps.
 
     Returns the inserted document with _id.
     """
-    coll = db[collection_name]
-    doc = {**data, "created_at": _now(), "updated_at": _now()}
-    res = coll.insert_one(doc)
+    coll = _coll(collection_name)
+    now = _now()
+    doc = {**data, "created_at": now, "updated_at": now}
+    res = await coll.insert_one(doc)
     doc["_id"] = res.inserted_id
     return doc
 
 
-def get_documents(collection_name: str, filter_dict: Optional[Dict[str, Any]] = None, limit: Optional[int] = None, sort: Optional[list] = None) -> list[Dict[str, Any]]:
-    """Query documents with optional filter, limit and sort."""
-    coll = db[collection_name]
-    cursor = coll.find(filter_dict or {})
+async def create_documents(
+    collection_name: str,
+    items: List[Dict[str, Any]],
+    chunk_size: int = 1000,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Insert many documents as unordered batches of ``chunk_size``.
+
+    Small uploads go out as a single insert_many; larger ones are split into
+    chunks, at most MONGO_BULK_CONCURRENCY of them in flight at once so a big
+    upload can't drain the connection pool for other requests.
+
+    Returns the inserted documents (with _id) and the write errors, whose
+    "index" refers to the position in ``items``. A chunk that fails outright
+    reports each of its documents with ``"status": "unknown"``, since the
+    server may have committed part of it.
+    """
+    if not items:
+        return [], []
+    coll = _coll(collection_name)
+    now = _now()
+    docs = [{**data, "created_at": now, "updated_at": now} for data in items]
+    starts = range(0, len(docs), chunk_size)
+    sem = asyncio.Semaphore(MONGO_BULK_CONCURRENCY)
+
+    async def insert_chunk(start: int) -> List[Dict[str, Any]]:
+        async with sem:
+            try:
+                await coll.insert_many(docs[start:start + chunk_size], ordered=False, bypass_document_validation=True)
+            except BulkWriteError as e:
+                return [{**err, "index": err["index"] + start} for err in e.details.get("writeErrors", [])]
+        return []
+
+    results = await asyncio.gather(*(insert_chunk(start) for start in starts), return_exceptions=True)
+    write_errors = []
+    for start, result in zip(starts, results):
+        if isinstance(result, BaseException):
+            logger.warning("bulk insert chunk at %d failed: %s", start, result)
+            # part of an unordered batch may have committed before the failure
+            write_errors.extend(
+                {"index": i, "status": "unknown", "errmsg": f"batch insert failed, row may or may not have been written: {result}"}
+                for i in range(start, min(start + chunk_size, len(docs)))
+            )
+        else:
+            write_errors.extend(result)
+    if not write_errors:
+        return docs, []
+    failed = {err["index"] for err in write_errors}
+    return [d for i, d in enumerate(docs) if i not in failed], write_errors
+
+
+async def get_documents(
+    collection_name: str,
+    filter_dict: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    sort: Optional[list] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    hint: Optional[list] = None,
+    batch_size: int = 500,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream documents with optional filter, limit, sort, projection and index hint.
+
+    Documents are yielded as cursor batches arrive instead of being collected
+    into a list first.
+    """
+    coll = _coll(collection_name)
+    cursor = coll.find(filter_dict or {}, projection)
     if sort:
         cursor = cursor.sort(sort)
+    if hint:
+        cursor = cursor.hint(hint)
     if limit:
         cursor = cursor.limit(int(limit))
-    return list(cursor)
+    # a negative limit is Mongo's "single batch of |limit|"; batch_size must be positive
+    cursor = cursor.batch_size(min(abs(int(limit or batch_size)), batch_size))
+    async for doc in cursor:
+        yield doc
@@ -1,17 +1,34 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import List, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
-from database import db, create_document, get_documents
-from schemas import Draw, DrawOut, Prediction, PredictionOut, BulkDraws
+from database import CACHE_COLL, DRAW_COLL, DRAW_LIST_HINT, PRED_COLL, PRED_LIST_HINT, _now, create_document, create_documents, get_documents
+from parsing import parse_csv_draws, parse_json_draws, parse_text_draws
+from schemas import Draw, DrawOut, Prediction, PredictionOut, BulkDraws, number_mask
 
-app = FastAPI(title="EuroJackpot AI API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Backfill matches for predictions saved before the current latest draw.
+    # The insights summary is only written after a refresh completes, so if it
+    # already names the latest date there is nothing to backfill.
+    latest = await latest_draw()
+    cached = await CACHE_COLL.find_one({"_id": INSIGHTS_ID}, {"summary.latest_date": 1})
+    expected = str(latest["date"]) if latest else None
+    if not cached or cached.get("summary", {}).get("latest_date") != expected:
+        await refresh_latest_matches(latest)
+    yield
+
+
+app = FastAPI(title="EuroJackpot AI API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,171 +39,355 @@ app.add_middleware(
 )
 
 
+# Only fetch the fields the response models read. main/euro are arrays, so the
+# indexes are multikey and can't cover these reads, but the projection still
+# keeps internal fields off the wire.
+def _projection(model) -> dict:
+    return {f.alias or name: 1 for name, f in model.model_fields.items()}
+
+
+DRAW_PROJECTION = _projection(DrawOut)
+PREDICTION_PROJECTION = _projection(PredictionOut)
+
+# Validate whole list responses in one call rather than one model per row
+_DRAWS_ADAPTER = TypeAdapter(List[DrawOut])
+_PREDS_ADAPTER = TypeAdapter(List[PredictionOut])
+
+
+async def json_array_response(docs: AsyncIterator[dict], adapter: TypeAdapter, chunk_size: int = 100) -> StreamingResponse:
+    """Stream documents as a JSON array while the cursor is still being read.
+
+    Documents are validated and serialized ``chunk_size`` at a time through the
+    list adapter. The first chunk is fetched and encoded before the response
+    starts, so a failing query or document still surfaces as an error status
+    rather than a truncated 200 body.
+    """
+    first = []
+    async for doc in docs:
+        first.append(doc)
+        if len(first) == chunk_size:
+            break
+    head = adapter.dump_json(adapter.validate_python(first), by_alias=True)
+
+    async def body():
+        if len(first) < chunk_size:
+            # the cursor is already exhausted
+            yield head
+            return
+        yield head[:-1]
+        chunk = []
+        async for doc in docs:
+            chunk.append(doc)
+            if len(chunk) == chunk_size:
+                yield b"," + adapter.dump_json(adapter.validate_python(chunk), by_alias=True)[1:-1]
+                chunk = []
+        if chunk:
+            yield b"," + adapter.dump_json(adapter.validate_python(chunk), by_alias=True)[1:-1]
+        yield b"]"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
 # --- Utility matching and simple learning metadata ---
 
+def with_masks(data: dict) -> dict:
+    """Attach main/euro bitmasks so matching never has to rebuild them on read."""
+    return {
+        **data,
+        "main_mask": number_mask(data.get("main", [])),
+        "euro_mask": number_mask(data.get("euro", [])),
+    }
+
+
+def _masks(doc: dict) -> tuple[int, int]:
+    main_mask = doc.get("main_mask")
+    euro_mask = doc.get("euro_mask")
+    if main_mask is None:
+        main_mask = number_mask(doc.get("main", []))
+    if euro_mask is None:
+        euro_mask = number_mask(doc.get("euro", []))
+    return main_mask, euro_mask
+
+
 def count_matches(pred: dict, draw: dict) -> dict:
-    main_matches = len(set(pred.get("main", [])) & set(draw.get("main", [])))
-    euro_matches = len(set(pred.get("euro", [])) & set(draw.get("euro", [])))
+    pred_main, pred_euro = _masks(pred)
+    draw_main, draw_euro = _masks(draw)
+    main_matches = (pred_main & draw_main).bit_count()
+    euro_matches = (pred_euro & draw_euro).bit_count()
     return {"main": main_matches, "euro": euro_matches, "total": main_matches + euro_matches}
 
 
+async def latest_draw() -> Optional[dict]:
+    return await DRAW_COLL.find_one(sort=[("date", -1)])
+
+
+def _draw_key(draw: Optional[dict]) -> Optional[tuple]:
+    # what predictions are scored against; other draw edits don't affect them
+    return (draw["date"], draw.get("main"), draw.get("euro")) if draw else None
+
+
+async def refresh_latest_matches(latest: Optional[dict], force: bool = False) -> None:
+    """Recompute matched.latest_match for predictions against ``latest``.
+
+    Only predictions scored against another date are touched unless ``force``
+    is set (the latest draw's numbers were edited in place). Runs as one
+    server-side pipeline update. Draw writes only call this when the latest
+    draw actually changed; startup calls it when the cached summary is missing
+    or names another date.
+    """
+    if not latest:
+        await rebuild_insights(None)
+        return
+    query = {} if force else {"matched.latest_match.date": {"$ne": latest["date"]}}
+    await PRED_COLL.update_many(query, [
+        {"$set": {"matched.latest_match": {
+            "main": {"$size": {"$setIntersection": [{"$ifNull": ["$main", []]}, {"$literal": latest.get("main", [])}]}},
+            "euro": {"$size": {"$setIntersection": [{"$ifNull": ["$euro", []]}, {"$literal": latest.get("euro", [])}]}},
+            "date": {"$literal": latest["date"]},
+        }}},
+        {"$set": {"matched.latest_match.total": {"$add": ["$matched.latest_match.main", "$matched.latest_match.euro"]}}},
+    ])
+    await rebuild_insights(latest)
+
+
+# --- Materialized insights ---
+# The /insights/latest summary is kept in the cache collection and rebuilt
+# whenever the latest draw changes; each process also holds it for
+# INSIGHTS_TTL seconds. It lists at most INSIGHTS_LIMIT predictions (highest
+# totals first) so the document stays far below Mongo's 16 MB cap and a $push
+# only ever rewrites a bounded array; matched_count carries the full count.
+
+INSIGHTS_ID = "latest_insights"
+INSIGHTS_TTL = 30.0
+INSIGHTS_LIMIT = 500
+_insights_cache: Optional[tuple[float, dict]] = None
+
+
+def _remember_insights(summary: Optional[dict]) -> None:
+    global _insights_cache
+    _insights_cache = (time.monotonic(), summary) if summary is not None else None
+
+
+async def rebuild_insights(latest: Optional[dict]) -> dict:
+    """Recompute the insights summary for ``latest`` and store it."""
+    if not latest:
+        summary = {"has_latest": False}
+    else:
+        # Matches are stored on write, so these are range scans on the
+        # (latest_match.date, latest_match.total) index
+        query = {"matched.latest_match.date": latest["date"], "matched.latest_match.total": {"$gt": 0}}
+        cursor = PRED_COLL.find(
+            query, {"_id": 1, "matched.latest_match": 1},
+        ).sort("matched.latest_match.total", -1).limit(INSIGHTS_LIMIT)
+        matched_preds = []
+        async for p in cursor:
+            m = p["matched"]["latest_match"]
+            matched_preds.append({"_id": str(p["_id"]), "matches": {"main": m["main"], "euro": m["euro"], "total": m["total"]}})
+        summary = {
+            "has_latest": True,
+            "latest_date": str(latest.get("date")),
+            "matched_count": await PRED_COLL.count_documents(query),
+            "matched_predictions": matched_preds,
+        }
+    await CACHE_COLL.replace_one({"_id": INSIGHTS_ID}, {"summary": summary}, upsert=True)
+    _remember_insights(summary)
+    return summary
+
+
 # --- Draws Endpoints ---
 
+def _oid(s: str) -> ObjectId:
+    if not ObjectId.is_valid(s):
+        raise HTTPException(status_code=400, detail="Invalid id")
+    return ObjectId(s)
+
+
 @app.get("/test")
-def test_root():
+async def test_root():
     # basic connectivity and counts
     return {
         "ok": True,
-        "draws": db["draw"].count_documents({}),
-        "predictions": db["prediction"].count_documents({}),
+        "draws": await DRAW_COLL.count_documents({}),
+        "predictions": await PRED_COLL.count_documents({}),
     }
 
 
 @app.post("/draws", response_model=DrawOut)
-def add_draw(draw: Draw):
-    # prevent duplicates by date
-    existing = db["draw"].find_one({"date": draw.date})
-    if existing:
+async def add_draw(draw: Draw):
+    # duplicates by date are rejected by the unique index
+    try:
+        doc = await create_document("draw", with_masks(draw.model_dump()))
+    except DuplicateKeyError:
         raise HTTPException(status_code=409, detail="Draw for this date already exists")
-    doc = create_document("draw", draw.model_dump())
+    # backfilling an older date leaves the latest draw, and so every score, as is
+    latest = await latest_draw()
+    if latest and latest["_id"] == doc["_id"]:
+        await refresh_latest_matches(latest)
     return DrawOut.model_validate(doc)
 
 
 @app.get("/draws", response_model=List[DrawOut])
-def list_draws(limit: Optional[int] = 200):
-    docs = get_documents("draw", {}, limit=limit, sort=[("date", -1)])
-    return [DrawOut.model_validate(d) for d in docs]
+async def list_draws(limit: Optional[int] = 200):
+    docs = get_documents(
+        "draw", {}, limit=limit, sort=[("date", -1)],
+        projection=DRAW_PROJECTION, hint=DRAW_LIST_HINT,
+    )
+    return await json_array_response(docs, _DRAWS_ADAPTER)
 
 
 @app.put("/draws/{draw_id}", response_model=DrawOut)
-def update_draw(draw_id: str, draw: Draw):
+async def update_draw(draw_id: str, draw: Draw):
+    oid = _oid(draw_id)
+    before = await latest_draw()
     try:
-        oid = ObjectId(draw_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid id")
-    res = db["draw"].find_one_and_update(
-        {"_id": oid},
-        {"$set": {**draw.model_dump(), "updated_at": datetime.utcnow()}},
-        return_document=True,
-    )
+        res = await DRAW_COLL.find_one_and_update(
+            {"_id": oid},
+            {"$set": {**with_masks(draw.model_dump()), "updated_at": _now()}},
+            return_document=True,
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Draw for this date already exists")
     if not res:
         raise HTTPException(status_code=404, detail="Not found")
+    after = await latest_draw()
+    if _draw_key(after) != _draw_key(before):
+        # same date means the numbers changed in place, so rescore every prediction
+        await refresh_latest_matches(after, force=before is not None and after["date"] == before["date"])
     return DrawOut.model_validate(res)
 
 
 @app.delete("/draws/{draw_id}")
-def delete_draw(draw_id: str):
-    try:
-        oid = ObjectId(draw_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid id")
-    res = db["draw"].delete_one({"_id": oid})
-    return {"deleted": res.deleted_count}
+async def delete_draw(draw_id: str):
+    oid = _oid(draw_id)
+    deleted = await DRAW_COLL.find_one_and_delete({"_id": oid}, projection={"date": 1})
+    if deleted:
+        latest = await latest_draw()
+        if latest is None or deleted["date"] > latest["date"]:
+            # the latest draw was removed; score against the one before it
+            await refresh_latest_matches(latest)
+    return {"deleted": 1 if deleted else 0}
 
 
 @app.delete("/draws")
-def clear_draws():
-    res = db["draw"].delete_many({})
+async def clear_draws():
+    res = await DRAW_COLL.delete_many({})
+    await rebuild_insights(None)
     return {"deleted": res.deleted_count}
 
 
 @app.post("/draws/bulk")
-def add_draws_bulk(payload: BulkDraws):
-    inserted = []
+async def add_draws_bulk(payload: BulkDraws):
     errors = []
+    duplicates = []
+    # validated draws and, in parallel, where each one came from in the payload
+    to_insert = []
+    origins = []
 
     # Parse CSV
     if payload.csv:
-        import csv, io
-
-        reader = csv.reader(io.StringIO(payload.csv))
-        for i, row in enumerate(reader):
-            if not row or row[0].strip().lower() in ("date", "data"):
-                continue
-            try:
-                d = Draw(
-                    date=row[0],
-                    main=list(map(int, row[1:6])),
-                    euro=list(map(int, row[6:8])),
-                )
-                doc = create_document("draw", d.model_dump())
-                inserted.append(str(doc["_id"]))
-            except Exception as e:
-                errors.append({"row": i + 1, "error": str(e)})
+        rows, csv_errors = parse_csv_draws(payload.csv)
+        errors.extend(csv_errors)
+        for row, data in rows:
+            to_insert.append(with_masks(data))
+            origins.append({"row": row})
 
     # Parse JSON
     if payload.json:
-        for i, item in enumerate(payload.json):
-            try:
-                d = Draw(**item)
-                doc = create_document("draw", d.model_dump())
-                inserted.append(str(doc["_id"]))
-            except Exception as e:
-                errors.append({"json_index": i, "error": str(e)})
+        rows, json_errors = parse_json_draws(payload.json)
+        errors.extend(json_errors)
+        for i, data in rows:
+            to_insert.append(with_masks(data))
+            origins.append({"json_index": i})
 
     # Parse free text
     if payload.text:
-        for i, line in enumerate(payload.text.splitlines()):
-            if not line.strip():
-                continue
-            try:
-                # Format: YYYY-MM-DD; m1 m2 m3 m4 m5; e1 e2
-                parts = [p.strip() for p in line.split(";")]
-                d = Draw(
-                    date=parts[0],
-                    main=list(map(int, parts[1].split()[:5])),
-                    euro=list(map(int, parts[2].split()[:2])),
-                )
-                doc = create_document("draw", d.model_dump())
-                inserted.append(str(doc["_id"]))
-            except Exception as e:
-                errors.append({"line": i + 1, "error": str(e)})
-
-    return {"inserted": inserted, "errors": errors}
+        rows, text_errors = parse_text_draws(payload.text)
+        errors.extend(text_errors)
+        for line, data in rows:
+            to_insert.append(with_masks(data))
+            origins.append({"line": line})
+
+    # Repeated dates inside the payload: the first occurrence wins, independent
+    # of the order the insert chunks happen to commit in
+    seen = set()
+    unique_rows, unique_origins = [], []
+    for data, origin in zip(to_insert, origins):
+        if data["date"] in seen:
+            duplicates.append({**origin, "date": str(data["date"])})
+            continue
+        seen.add(data["date"])
+        unique_rows.append(data)
+        unique_origins.append(origin)
+    to_insert, origins = unique_rows, unique_origins
+
+    # Batched round-trips; failed rows don't abort the rest
+    docs, write_errors = await create_documents("draw", to_insert)
+    for err in write_errors:
+        if err.get("code") == 11000:
+            duplicates.append({**origins[err["index"]], "date": str(to_insert[err["index"]]["date"])})
+        elif err.get("status") == "unknown":
+            errors.append({**origins[err["index"]], "status": "unknown", "error": err["errmsg"]})
+        else:
+            errors.append({**origins[err["index"]], "error": err.get("errmsg", "write failed")})
+    if docs:
+        latest = await latest_draw()
+        if latest and latest["_id"] in {d["_id"] for d in docs}:
+            await refresh_latest_matches(latest)
+
+    return {"inserted": [str(d["_id"]) for d in docs], "duplicates": duplicates, "errors": errors}
 
 
 # --- Predictions Endpoints ---
 
 @app.post("/predictions", response_model=PredictionOut)
-def save_prediction(pred: Prediction):
+async def save_prediction(pred: Prediction):
     # Attach match info against latest draw (if exists)
-    latest = db["draw"].find_one(sort=[("date", -1)])
+    latest = await latest_draw()
+    data = with_masks(pred.model_dump())
     matched = None
     if latest:
-        matched = count_matches(pred.model_dump(), latest)
-    doc = create_document("prediction", {**pred.model_dump(), "matched": {"latest_match": matched}})
+        matched = {**count_matches(data, latest), "date": latest["date"]}
+    doc = await create_document("prediction", {**data, "matched": {"latest_match": matched}})
+    if matched and matched["total"] > 0:
+        entry = {"_id": str(doc["_id"]), "matches": {k: matched[k] for k in ("main", "euro", "total")}}
+        await CACHE_COLL.update_one(
+            {"_id": INSIGHTS_ID, "summary.latest_date": str(latest["date"])},
+            {
+                "$inc": {"summary.matched_count": 1},
+                "$push": {"summary.matched_predictions": {
+                    "$each": [entry], "$sort": {"matches.total": -1}, "$slice": INSIGHTS_LIMIT,
+                }},
+            },
+        )
+        _remember_insights(None)
     return PredictionOut.model_validate(doc)
 
 
 @app.get("/predictions", response_model=List[PredictionOut])
-def list_predictions(limit: Optional[int] = 200):
-    docs = get_documents("prediction", {}, limit=limit, sort=[("created_at", -1)])
-    return [PredictionOut.model_validate(d) for d in docs]
+async def list_predictions(limit: Optional[int] = 200):
+    docs = get_documents(
+        "prediction", {}, limit=limit, sort=[("created_at", -1)],
+        projection=PREDICTION_PROJECTION, hint=PRED_LIST_HINT,
+    )
+    return await json_array_response(docs, _PREDS_ADAPTER)
 
 
 @app.delete("/predictions")
-def clear_predictions():
-    res = db["prediction"].delete_many({})
+async def clear_predictions():
+    res = await PRED_COLL.delete_many({})
+    await rebuild_insights(await latest_draw())
     return {"deleted": res.deleted_count}
 
 
 # --- Simple insights endpoint ---
 
 @app.get("/insights/latest")
-def latest_insights():
-    latest = db["draw"].find_one(sort=[("date", -1)])
-    if not latest:
-        return {"has_latest": False}
-
-    # Count how many past predictions matched at least one number of latest draw
-    matched_preds = []
-    for p in db["prediction"].find().sort("created_at", -1):
-        m = count_matches(p, latest)
-        if m["total"] > 0:
-            matched_preds.append({"_id": str(p["_id"]), "matches": m})
-
-    return {
-        "has_latest": True,
-        "latest_date": str(latest.get("date")),
-        "matched_predictions": matched_preds,
-    }
+async def latest_insights():
+    # the summary is plain JSON already, so hand it straight to orjson
+    if _insights_cache and time.monotonic() - _insights_cache[0] < INSIGHTS_TTL:
+        return ORJSONResponse(_insights_cache[1])
+    cached = await CACHE_COLL.find_one({"_id": INSIGHTS_ID})
+    if cached:
+        _remember_insights(cached["summary"])
+        return ORJSONResponse(cached["summary"])
+    return ORJSONResponse(await rebuild_insights(await latest_draw()))
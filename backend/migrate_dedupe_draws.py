@@ -0,0 +1,53 @@
+"""
+One-off migration: resolve draws that share a date.
+
+The unique draw.date index can't be built while duplicates exist, and the
+server refuses to start until they're gone. This lists every duplicated date
+with its draws; with --apply it keeps one draw per date (the first inserted,
+or the one named with --keep) and deletes the others.
+
+    python migrate_dedupe_draws.py                    # dry run
+    python migrate_dedupe_draws.py --apply
+    python migrate_dedupe_draws.py --apply --keep <id> --keep <id>
+"""
+
+from __future__ import annotations
+
+import argparse
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from database import DATABASE_NAME, DATABASE_URL, find_duplicate_draws
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="delete the extra draws (default: dry run)")
+    parser.add_argument("--keep", action="append", default=[], help="draw _id to keep for its date (repeatable)")
+    args = parser.parse_args()
+    keep = {ObjectId(k) for k in args.keep}
+
+    with MongoClient(DATABASE_URL, uuidRepresentation="standard") as client:
+        draws = client[DATABASE_NAME]["draw"]
+        groups = find_duplicate_draws(client[DATABASE_NAME])
+        if not groups:
+            print("no duplicate draw dates")
+            return
+        extra = []
+        for group in groups:
+            chosen = next((oid for oid in group["ids"] if oid in keep), group["ids"][0])
+            print(f"{group['_id']}:")
+            for d in draws.find({"_id": {"$in": group["ids"]}}, {"main": 1, "euro": 1, "source": 1}):
+                mark = "keep  " if d["_id"] == chosen else "delete"
+                print(f"  {mark} {d['_id']} main={d.get('main')} euro={d.get('euro')} source={d.get('source')}")
+            extra.extend(oid for oid in group["ids"] if oid != chosen)
+        if not args.apply:
+            print(f"dry run: {len(extra)} draws would be deleted; re-run with --apply")
+            return
+        res = draws.delete_many({"_id": {"$in": extra}})
+        print(f"deleted {res.deleted_count} draws")
+
+
+if __name__ == "__main__":
+    main()
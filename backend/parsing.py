@@ -0,0 +1,164 @@
+"""
+Bulk draw payload parsers
+
+Turn the csv / json / text fields of a BulkDraws payload into validated draw
+dicts. Each parser returns ``(position, draw)`` pairs for the valid entries
+plus a list of per-entry errors; /draws/bulk stamps masks and inserts them.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import re
+from datetime import date
+from typing import List
+
+import numpy as np
+from pydantic import TypeAdapter, ValidationError
+
+from schemas import Draw
+
+
+# A CSV number cell: optional sign and a few digits. Out-of-range values such
+# as -1 or 050 parse here and are rejected by the range checks below.
+_CSV_INT_RE = re.compile(r"[+-]?[0-9]{1,4}")
+_DATE = TypeAdapter(date)
+
+
+def parse_csv_draws(text: str) -> tuple[list[tuple[int, dict]], list[dict]]:
+    """Parse CSV draws, validating the numbers column-wise with NumPy.
+
+    Columns: date, main1..main5, euro1, euro2 (extra columns are ignored).
+    Returns ``(row, draw)`` pairs for valid rows plus per-row errors sorted by
+    row; rows are numbered by the physical line they start on.
+    """
+    errors = []
+    lines, dates, cells = [], [], []
+    reader = csv.reader(io.StringIO(text))
+    end = 0
+    while True:
+        line = end + 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            # e.g. a field over csv's size limit; only this record is rejected
+            errors.append({"row": line, "error": str(e)})
+            continue
+        finally:
+            end = reader.line_num
+        if not row or row[0].strip().lower() in ("date", "data"):
+            continue
+        if len(row) < 8:
+            errors.append({"row": line, "error": "Expected 8 columns: date, main1..main5, euro1, euro2"})
+            continue
+        nums = [c.strip() for c in row[1:8]]
+        if not all(_CSV_INT_RE.fullmatch(c) for c in nums):
+            errors.append({"row": line, "error": "Numbers must be integers"})
+            continue
+        lines.append(line)
+        dates.append(row[0].strip())
+        cells.extend(map(int, nums))
+    if not lines:
+        return [], errors
+
+    values = np.array(cells, dtype=np.int64).reshape(-1, 7)
+    main, euro = values[:, :5], values[:, 5:]
+    main_range = ((main >= 1) & (main <= 50)).all(axis=1)
+    euro_range = ((euro >= 1) & (euro <= 12)).all(axis=1)
+    main_unique = (np.diff(np.sort(main, axis=1), axis=1) > 0).all(axis=1)
+    euro_unique = euro[:, 0] != euro[:, 1]
+    valid = main_range & euro_range & main_unique & euro_unique
+
+    rows = []
+    for i, line in enumerate(lines):
+        if not valid[i]:
+            # same order and messages as the Draw validators
+            if not main_unique[i]:
+                msg = "Main numbers must be unique and length 5"
+            elif not main_range[i]:
+                msg = "Main numbers must be in 1..50"
+            elif not euro_unique[i]:
+                msg = "Euro numbers must be unique and length 2"
+            else:
+                msg = "Euro numbers must be in 1..12"
+            errors.append({"row": line, "error": msg})
+            continue
+        try:
+            # the date rules Draw applies to the JSON and text formats
+            day = _DATE.validate_python(dates[i])
+        except ValidationError as e:
+            errors.append({"row": line, "error": f"Invalid date {dates[i][:20]!r}: {e.errors()[0]['msg']}"})
+            continue
+        rows.append((line, {"date": day, "main": main[i].tolist(), "euro": euro[i].tolist(), "source": None}))
+    errors.sort(key=lambda e: e["row"])
+    return rows, errors
+
+
+_DRAWS_IN = TypeAdapter(List[Draw])
+
+
+def parse_json_draws(items: list) -> tuple[list[tuple[int, dict]], list[dict]]:
+    """Validate a list of draw objects in one TypeAdapter call.
+
+    Returns ``(index, draw)`` pairs for valid items plus per-index errors.
+    """
+    try:
+        return [(i, d.model_dump()) for i, d in enumerate(_DRAWS_IN.validate_python(items))], []
+    except ValidationError as err:
+        failed: dict[int, list[str]] = {}
+        for e in err.errors():
+            field = ".".join(map(str, e["loc"][1:]))
+            failed.setdefault(e["loc"][0], []).append(f"{field}: {e['msg']}" if field else e["msg"])
+    # items validate independently, so the rest go through as one batch again
+    keep = [i for i in range(len(items)) if i not in failed]
+    draws = _DRAWS_IN.validate_python([items[i] for i in keep])
+    rows = [(i, d.model_dump()) for i, d in zip(keep, draws)]
+    return rows, [{"json_index": i, "error": "; ".join(msgs)} for i, msgs in sorted(failed.items())]
+
+
+# Free-text format, one draw per line: YYYY-MM-DD; m1 m2 m3 m4 m5; e1 e2
+_TEXT_RE = re.compile(
+    r"^[ \t]*(\d{4}-\d{2}-\d{2})[ \t]*;"
+    r"[ \t]*(\d+)[ \t]+(\d+)[ \t]+(\d+)[ \t]+(\d+)[ \t]+(\d+)[ \t]*;"
+    r"[ \t]*(\d+)[ \t]+(\d+)[ \t]*$",
+    re.M,
+)
+
+
+def parse_text_draws(text: str) -> tuple[list[tuple[int, dict]], list[dict]]:
+    """Parse free-text draws in one regex pass over the payload.
+
+    Returns ``(line, draw)`` pairs for valid lines plus per-line errors; lines
+    are numbered from 1 and blank lines are skipped.
+    """
+    # same line boundaries as str.splitlines (\r\n, bare \r, \x85, ...), so
+    # the regex and line accounting below only ever see \n
+    text = "\n".join(text.splitlines())
+    rows, errors = [], []
+    line, pos = 1, 0
+
+    def skipped(segment: str) -> int:
+        # non-blank text between two matches is a malformed line
+        pieces = segment.split("\n")
+        for k, piece in enumerate(pieces):
+            if piece.strip():
+                errors.append({"line": line + k, "error": "Expected 'YYYY-MM-DD; m1 m2 m3 m4 m5; e1 e2'"})
+        return len(pieces) - 1
+
+    for m in _TEXT_RE.finditer(text):
+        line += skipped(text[pos:m.start()])
+        pos = m.end()
+        try:
+            d = Draw(
+                date=m.group(1),
+                main=list(map(int, m.group(2, 3, 4, 5, 6))),
+                euro=[int(m.group(7)), int(m.group(8))],
+            )
+            rows.append((line, d.model_dump()))
+        except Exception as e:
+            errors.append({"line": line, "error": str(e)})
+    skipped(text[pos:])
+    return rows, errors
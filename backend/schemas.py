@@ -1,14 +1,34 @@
 from __future__ import annotations
 
-from datetime import date, datetime
-from typing import List, Optional
+import datetime as dt
+from typing import Annotated, List, Optional
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, BeforeValidator, Field, field_validator
+
+# Mongo hands back ObjectId for _id; responses carry it as a string
+ObjectIdStr = Annotated[str, BeforeValidator(str)]
+
+
+def number_mask(nums: List[int]) -> int:
+    """Encode a set of numbers as a bitmask: bit n is set when n is drawn.
+
+    Numbers outside 0..63 map to bit 0, which no valid mask contains, so
+    untrusted input can't build huge ints.
+    """
+    m = 0
+    for n in nums:
+        m |= 1 << n if 0 <= n < 64 else 1
+    return m
+
+
+# Bits 1..50 and 1..12: every number a valid main / euro mask may contain
+VALID_MAIN = ((1 << 51) - 1) & ~1
+VALID_EURO = ((1 << 13) - 1) & ~1
 
 
 class Draw(BaseModel):
     # EuroJackpot draw: 5 main numbers (1..50) and 2 euro numbers (1..12)
-    date: date = Field(..., description="Draw date (YYYY-MM-DD)")
+    date: dt.date = Field(..., description="Draw date (YYYY-MM-DD)")
     main: List[int] = Field(..., min_items=5, max_items=5, description="Five main numbers")
     euro: List[int] = Field(..., min_items=2, max_items=2, description="Two euro numbers")
     source: Optional[str] = Field(None, description="Optional data source or note")
@@ -16,26 +36,29 @@ class Draw(BaseModel):
     @field_validator("main")
     @classmethod
     def validate_main(cls, v: List[int]) -> List[int]:
-        if len(set(v)) != 5:
+        m = number_mask(v)
+        # out-of-range numbers share bit 0, so confirm a short popcount is a real duplicate
+        if (len(v) != 5 or m.bit_count() != 5) and len(set(v)) != 5:
             raise ValueError("Main numbers must be unique and length 5")
-        if not all(1 <= n <= 50 for n in v):
+        if m & ~VALID_MAIN:
             raise ValueError("Main numbers must be in 1..50")
         return v
 
     @field_validator("euro")
     @classmethod
     def validate_euro(cls, v: List[int]) -> List[int]:
-        if len(set(v)) != 2:
+        m = number_mask(v)
+        if (len(v) != 2 or m.bit_count() != 2) and len(set(v)) != 2:
             raise ValueError("Euro numbers must be unique and length 2")
-        if not all(1 <= n <= 12 for n in v):
+        if m & ~VALID_EURO:
             raise ValueError("Euro numbers must be in 1..12")
         return v
 
 
 class DrawOut(Draw):
-    id: str = Field(..., alias="_id")
-    created_at: datetime
-    updated_at: datetime
+    id: ObjectIdStr = Field(..., alias="_id")
+    created_at: dt.datetime
+    updated_at: dt.datetime
 
 
 class Prediction(BaseModel):
@@ -49,22 +72,24 @@ class Prediction(BaseModel):
     @field_validator("main")
     @classmethod
     def v_main(cls, v: List[int]) -> List[int]:
-        if len(set(v)) != 5 or not all(1 <= n <= 50 for n in v):
+        m = number_mask(v)
+        if len(v) != 5 or m.bit_count() != 5 or m & ~VALID_MAIN:
             raise ValueError("Main numbers invalid")
         return v
 
     @field_validator("euro")
     @classmethod
     def v_euro(cls, v: List[int]) -> List[int]:
-        if len(set(v)) != 2 or not all(1 <= n <= 12 for n in v):
+        m = number_mask(v)
+        if len(v) != 2 or m.bit_count() != 2 or m & ~VALID_EURO:
             raise ValueError("Euro numbers invalid")
         return v
 
 
 class PredictionOut(Prediction):
-    id: str = Field(..., alias="_id")
-    created_at: datetime
-    updated_at: datetime
+    id: ObjectIdStr = Field(..., alias="_id")
+    created_at: dt.datetime
+    updated_at: dt.datetime
     matched: Optional[dict] = None  # how many hits against latest draw
 
 
@@ -0,0 +1,52 @@
+from datetime import date
+
+from parsing import parse_text_draws
+
+GOOD_1 = "2024-01-05; 1 2 3 4 5; 6 7"
+GOOD_2 = "2024-01-12; 10 20 30 40 50; 1 12"
+BAD_LINE = "Expected 'YYYY-MM-DD; m1 m2 m3 m4 m5; e1 e2'"
+
+
+def _lines(rows):
+    return [line for line, _ in rows]
+
+
+def test_blank_lines_keep_physical_line_numbers():
+    rows, errors = parse_text_draws(f"\n{GOOD_1}\n\n\n{GOOD_2}\n\n")
+    assert errors == []
+    assert _lines(rows) == [2, 5]
+    assert rows[0][1]["date"] == date(2024, 1, 5)
+    assert rows[1][1]["main"] == [10, 20, 30, 40, 50]
+    assert rows[1][1]["euro"] == [1, 12]
+
+
+def test_malformed_line_between_good_lines():
+    rows, errors = parse_text_draws(f"{GOOD_1}\nnot a draw\n{GOOD_2}")
+    assert _lines(rows) == [1, 3]
+    assert errors == [{"line": 2, "error": BAD_LINE}]
+
+
+def test_malformed_first_and_last_lines():
+    rows, errors = parse_text_draws(f"header\n{GOOD_1}\ntrailer")
+    assert _lines(rows) == [2]
+    assert [e["line"] for e in errors] == [1, 3]
+
+
+def test_crlf_line_endings():
+    rows, errors = parse_text_draws(f"{GOOD_1}\r\n\r\nbad\r\n{GOOD_2}\r\n")
+    assert _lines(rows) == [1, 4]
+    assert errors == [{"line": 3, "error": BAD_LINE}]
+
+
+def test_bare_cr_line_endings():
+    rows, errors = parse_text_draws(f"{GOOD_1}\r{GOOD_2}\r")
+    assert errors == []
+    assert _lines(rows) == [1, 2]
+
+
+def test_invalid_numbers_are_reported_on_their_line():
+    rows, errors = parse_text_draws(f"{GOOD_1}\n2024-01-19; 1 1 2 3 4; 6 7")
+    assert _lines(rows) == [1]
+    assert len(errors) == 1
+    assert errors[0]["line"] == 2
+    assert "unique" in errors[0]["error"]